@@ -0,0 +1,166 @@
+# Prosody helpers for the Sloka Meter Visualizer: IAST → SLP1 syllables,
+# guru/laghu weights, vipulā, pathyā, yamaka and anuprāsa detectors.
+# Kept free of Streamlit so its caches survive script reruns.
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+from indic_transliteration import sanscript
+from indic_transliteration.sanscript import transliterate, SchemeMap, SCHEMES
+
+# ===== CONFIG =====
+long_vowels = set('AIUFXeEoO')
+
+_VOWELS = frozenset('aAiIuUfFxXeEoO')
+_MH = frozenset('MH')
+
+# SLP1 is single-byte ASCII: per-byte class tables for guru_flags
+_VOWEL_LUT, _LONG_LUT, _MH_LUT = (np.array([chr(c) in cls for c in range(256)]) for cls in (_VOWELS, long_vowels, _MH))
+
+# transliterate() rebuilds its SchemeMap on every call unless given one
+_SM_IAST_SLP1 = SchemeMap(SCHEMES[sanscript.IAST], SCHEMES[sanscript.SLP1])
+_SM_SLP1_IAST = SchemeMap(SCHEMES[sanscript.SLP1], SCHEMES[sanscript.IAST])
+_SEP = '\x1f'  # joins pādas/syllables for batch transliteration; untouched by either scheme, never inside a syllable
+
+# fixed character sets, so str.translate rather than the regex engine
+# pāda breaks; padded with spaces so the transliterator still sees a word boundary
+# (a standalone om/oṃ becomes AUM, as when each pāda was transliterated alone)
+_DANDA_TAB = str.maketrans(dict.fromkeys('।॥|', f' {_SEP} '))
+# separators become spaces so letters on either side never fuse into one SLP1 letter
+# (tad-hita ≠ taDita, ka-i ≠ kE); the splitter drops the spaces after transliteration
+_PUNCT_TAB = str.maketrans({**dict.fromkeys('"\'()[]{}⟨⟩—–-', ' '),
+                            **dict.fromkeys('।॥|,.;:!?0123456789०१२३४५६७८९')})  # deleted
+
+# vipulā by the weights of a pāda's first four syllables packed as g0<<3|g1<<2|g2<<1|g3
+_VIPULA_LUT = [None] * 16
+_VIPULA_LUT[0b0101] = 'Nagari'      # l g l g
+_VIPULA_LUT[0b0001] = 'Bhavani'     # l l l g
+_VIPULA_LUT[0b0011] = 'Shardula'    # l l g g
+_VIPULA_LUT[0b1011] = 'Arya'        # g l g g
+_VIPULA_LUT[0b1101] = 'Vidyunmala'  # g g l g
+
+# pathyā on a 32-syllable block packed little-endian (bit i = syllable i):
+# 21st laghu, 22nd, 29th and 30th guru
+_PATHYA_MASK = 1 << 20 | 1 << 21 | 1 << 28 | 1 << 29
+_PATHYA_BITS = 1 << 21 | 1 << 28 | 1 << 29
+
+# ===== HELPERS =====
+
+def normalize(text: str) -> str:
+    text = text.strip()
+    if not text.isascii():  # ASCII is already NFC
+        text = unicodedata.normalize('NFC', text)
+    text = text.translate(_PUNCT_TAB)  # blank out separators, strip punctuation & digits
+    return transliterate(text, scheme_map=_SM_IAST_SLP1)
+
+
+@lru_cache(maxsize=4096)
+def split_syllables_slp1(txt: str) -> Tuple[str, ...]:
+    """IAST→SLP1 string → tuple of syllables following classical rules.
+    • single consonant after a short vowel joins *next* syllable
+    • ≥2 consonants: first stays in coda, rest shift to onset
+    • anusvāra/visarga (M/H) stay with nucleus"""
+    s = ''.join(txt.split())  # drop all whitespace, same set as \s
+    vowels, mh = _VOWELS, _MH  # local lookups in the scan loops
+    out, n, i = [], len(s), 0
+    append = out.append
+    while i < n:
+        j = i
+        while j < n and s[j] not in vowels:
+            j += 1
+        if j >= n:
+            break
+        k = j + 1
+        if k < n and s[k] in mh:
+            k += 1
+        c = k
+        while c < n and s[c] not in vowels:
+            c += 1
+        cluster_len = c - k
+        if cluster_len == 0 or cluster_len == 1:
+            cut = k  # open syllable or single consonant migrates
+        else:
+            cut = k + 1  # keep first, shift rest
+        append(s[i:cut])
+        i = cut
+    if i < n:
+        append(s[i:])
+    return tuple(out)  # cached, so hand out an immutable copy
+
+
+def lines_to_iast(lines: List[List[str]]) -> List[List[str]]:
+    """SLP1 syllables → IAST display strings with a single transliterate call"""
+    flat = transliterate(_SEP.join(s for r in lines for s in r), scheme_map=_SM_SLP1_IAST)
+    it = iter(flat.split(_SEP))
+    return [[next(it) for _ in r] for r in lines]
+
+
+def vipula_rows(grid: np.ndarray, lens: np.ndarray) -> List[Optional[str]]:
+    """vipulā of every row of a guru_grid from its first four bits, None for rows under 4 syllables"""
+    head = np.zeros((len(grid), 4), dtype=np.intp)
+    head[:, :grid.shape[1]] = grid[:, :4]
+    codes = head @ (8, 4, 2, 1)
+    return [_VIPULA_LUT[c] if n >= 4 else None for c, n in zip(codes, lens)]
+
+
+def guru_flags(syls: List[str]) -> np.ndarray:
+    """guru bit per syllable (long nucleus, or M/H or coda after it) from one
+    ASCII buffer + offsets, classified in NumPy"""
+    n = len(syls)
+    buf = np.frombuffer(''.join(syls).encode('latin-1', 'replace'), dtype=np.uint8)
+    if not n or not len(buf):
+        return np.zeros(n, dtype=np.uint8)
+    ends = np.cumsum(np.fromiter(map(len, syls), dtype=np.intp, count=n))
+    starts = np.concatenate(([0], ends[:-1]))
+    # first vowel or M/H in each syllable (len(buf) if none); syllables are never empty
+    pos = np.where(_VOWEL_LUT[buf] | _MH_LUT[buf], np.arange(len(buf)), len(buf))
+    first = np.minimum.reduceat(pos, starts)
+    hit = first < ends
+    at = np.where(hit, first, 0)
+    nucleus = hit & _VOWEL_LUT[buf[at]]
+    return (nucleus & (_LONG_LUT[buf[at]] | (first + 1 < ends))).astype(np.uint8)
+
+
+def guru_grid(lines: List[List[str]]) -> np.ndarray:
+    """rows × cols uint8 guru bits, cells past the end of a short row are 0"""
+    lens = np.fromiter(map(len, lines), dtype=np.intp, count=len(lines))
+    cols = int(lens.max()) if len(lines) else 0
+    flags = guru_flags([s for r in lines for s in r])
+    grid = np.zeros((len(lines), cols), dtype=np.uint8)
+    grid[np.arange(cols) < lens[:, None]] = flags  # row-major fill
+    return grid
+
+
+@lru_cache(maxsize=4096)
+def onset(syl: str) -> str:
+    """leading consonants of a syllable, '' if it starts with a vowel"""
+    for i, ch in enumerate(syl):
+        if ch in _VOWELS:
+            return syl[:i]
+    return syl
+
+def detect_vrttyanuprasa(line: List[str]) -> bool:
+    if len(line) < 7:
+        return False
+    onsets = [onset(s) for s in line[4:7]]
+    return len(set(onsets)) == 1 and onsets[0]
+
+
+def block_flags(flat: List[str], guru: np.ndarray) -> np.ndarray:
+    """pathyā, pāda-ādi yamaka and pāda-anta yamaka for every complete
+    32-syllable block at once → (n_blocks, 3) bool array"""
+    nb = len(flat) // 32
+    ids = {}  # syllable → small int, so yamaka tests are integer compares
+    codes = np.fromiter((ids.setdefault(s, len(ids)) for s in flat[:nb * 32]), dtype=np.intp, count=nb * 32)
+    codes = codes.reshape(nb, 4, 8)
+    words = np.packbits(guru[:nb * 32].reshape(nb, 32), axis=1, bitorder='little').view('<u4')[:, 0]
+    pathya = (words & _PATHYA_MASK) == _PATHYA_BITS
+    adi, anta = codes[:, :, 0], codes[:, :, 7]
+    return np.stack([pathya, (adi == adi[:, :1]).all(1), (anta == anta[:, :1]).all(1)], axis=1)
+
+
+def analyse(text: str) -> List[Tuple[str, ...]]:
+    """raw text → one syllable tuple per pāda (split on |, ।, ॥)"""
+    # one normalize/transliterate pass for the whole input; pāda breaks survive as _SEP
+    slp = normalize(text.translate(_DANDA_TAB))
+    return [split_syllables_slp1(p) for p in slp.split(_SEP) if p.strip()]
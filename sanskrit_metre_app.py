@@ -1,15 +1,12 @@
 # Sloka Meter Visualizer — updated Mālinī‑aware version
+import io
 import streamlit as st
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, Patch
-import re, unicodedata
-from typing import List, Optional
-from indic_transliteration import sanscript
-from indic_transliteration.sanscript import transliterate
+import numpy as np
+from typing import List, Tuple
+import prosody
+from prosody import vipula_rows, detect_vrttyanuprasa, block_flags, guru_grid, lines_to_iast
 
 # ===== CONFIG =====
-long_vowels = set('AIUFXeEoO')
-
 vipula_colors = {
     'Nagari': '#FF7F00',
     'Bhavani': '#1E3F66',
@@ -17,134 +14,120 @@ vipula_colors = {
     'Arya': '#8B0000',
     'Vidyunmala': '#9932CC'
 }
+page_padas = 64  # input lines (pādas) per page, at least; see page_starts
 
-# ===== HELPERS =====
-
-def normalize(text: str) -> str:
-    text = unicodedata.normalize('NFC', text.strip())
-    text = re.sub(r'[।॥|,.;:!?\d]', '', text)  # strip punctuation & digits
-    return transliterate(text, sanscript.IAST, sanscript.SLP1)
-
-
-def split_syllables_slp1(txt: str) -> List[str]:
-    """IAST→SLP1 string → list of syllables following classical rules.
-    • single consonant after a short vowel joins *next* syllable
-    • ≥2 consonants: first stays in coda, rest shift to onset
-    • anusvāra/visarga (M/H) stay with nucleus"""
-    s = re.sub(r"\s+", "", txt)
-    vowels = set('aAiIuUfFxXeEoO')
-    out, n, i = [], len(s), 0
-    while i < n:
-        j = i
-        while j < n and s[j] not in vowels:
-            j += 1
-        if j >= n:
-            break
-        k = j + 1
-        if k < n and s[k] in 'MH':
-            k += 1
-        c = k
-        while c < n and s[c] not in vowels:
-            c += 1
-        cluster_len = c - k
-        if cluster_len == 0 or cluster_len == 1:
-            cut = k  # open syllable or single consonant migrates
-        else:
-            cut = k + 1  # keep first, shift rest
-        out.append(s[i:cut])
-        i = cut
-    if i < n:
-        out.append(s[i:])
-    return out
-
-
-def is_guru(syl: str) -> bool:
-    m = re.match(r'^([^aAiIuUfFxXeEoOMH]*)([aAiIuUfFxXeEoO])([MH]?)(.*)$', syl)
-    if not m:
-        return False
-    _, v, nas, coda = m.groups()
-    return v in long_vowels or nas or len(coda) >= 1  # ≥1 coda consonant = heavy
-
-
-def identify_vipula(syls: List[str]) -> Optional[str]:
-    if len(syls) < 4:
-        return None
-    pat = ''.join('g' if is_guru(s) else 'l' for s in syls[:4])
-    return {
-        'lglg': 'Nagari', 'lllg': 'Bhavani', 'llgg': 'Shardula',
-        'glgg': 'Arya', 'gglg': 'Vidyunmala'
-    }.get(pat)
-
-# simple detectors kept unchanged (pathyā, yamaka, anuprāsa)
-
-def classify_pathya(block: List[str]) -> bool:
-    return (len(block) >= 32 and
-            not is_guru(block[20]) and is_guru(block[21]) and
-            is_guru(block[28]) and is_guru(block[29]))
-
-def detect_padayadi_yamaka(b: List[str]) -> bool:
-    return len(b) >= 32 and len({b[i*8] for i in range(4)}) == 1
-
-def detect_padaanta_yamaka(b: List[str]) -> bool:
-    return len(b) >= 32 and len({b[i*8+7] for i in range(4)}) == 1
-
-def detect_vrttyanuprasa(line: List[str]) -> bool:
-    if len(line) < 7:
-        return False
-    onsets = []
-    for s in line[4:7]:
-        m = re.match(r'^([^aAiIuUfFxXeEoO]+)', s)
-        onsets.append(m.group(1) if m else '')
-    return len(set(onsets)) == 1 and onsets[0]
+@st.cache_data(max_entries=64, show_spinner=False)
+def analyse(text: str) -> List[Tuple[str, ...]]:
+    """prosody.analyse, cached across reruns and sessions on the raw text"""
+    return prosody.analyse(text)
 
 # ===== VIS =====
 
-def visualize_lines(lines: List[List[str]]):
-    rows = len(lines)
-    cols = max(map(len, lines)) if rows else 0
-    if not rows or not cols:
-        st.error('No data')
-        return
-
-    disp = [[transliterate(s, sanscript.SLP1, sanscript.IAST) for s in r] for r in lines]
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_png(lines: List[Tuple[str, ...]]) -> bytes:
+    """the grid as PNG bytes; cached, so unchanged input never reaches matplotlib again"""
+    # matplotlib is imported on first draw, not at page load
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+    from matplotlib.collections import PatchCollection, PathCollection
+    from matplotlib.colors import ListedColormap
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.textpath import TextPath
+    from matplotlib.transforms import Affine2D, IdentityTransform
+
+    rows, cols = len(lines), max(map(len, lines))
+    disp = lines_to_iast(lines)
     flat = [s for r in lines for s in r]
+    grid = guru_grid(lines)
+    lens = np.fromiter(map(len, lines), dtype=np.intp, count=rows)
 
-    fig, ax = plt.subplots(figsize=(cols * 0.55, rows * 0.55))
+    fig = Figure(figsize=(cols * 0.55, rows * 0.55))  # not pyplot: nothing to close, no global registry
+    ax = fig.add_subplot()
     ax.set(xlim=(0, cols), ylim=(0, rows)); ax.axis('off'); ax.set_aspect('equal')
 
-    for r, row in enumerate(lines):
+    # one QuadMesh for all cells; row 0 is drawn at the top, missing cells masked
+    empty = np.arange(cols) >= lens[:, None]
+    edges = np.where(empty[::-1].ravel()[:, None], (0, 0, 0, 0), (0.5, 0.5, 0.5, 1))
+    ax.pcolormesh(np.arange(cols + 1), np.arange(rows + 1), np.ma.masked_array(grid, empty)[::-1],
+                  cmap=ListedColormap(['white', 'black']), vmin=0, vmax=1, edgecolors=edges, linewidth=0.8, zorder=1)
+
+    # labels as glyph outlines in one PathCollection rather than one Text artist per cell:
+    # each distinct label is laid out once, in points, centred on the origin
+    prop = FontProperties(size=9)
+    line = TextPath((0, 0), 'lp', prop=prop).get_extents()  # line box, for va='center'
+    shapes = {}
+    def shape(label):
+        p = shapes.get(label)
+        if p is None:
+            p = TextPath((0, 0), label, prop=prop)
+            x0, x1 = p.get_extents().intervalx
+            p = shapes[label] = p.transformed(Affine2D().translate(-(x0 + x1) / 2, -(line.y0 + line.y1) / 2))
+        return p
+
+    paths, offsets, colors = [], [], []
+    # labels only for real syllables (zip stops at the row's end, not the padded grid width)
+    for r, (labels, weights) in enumerate(zip(disp, grid.tolist())):
         y = rows - 1 - r
-        for c, syl in enumerate(row):
-            g = is_guru(syl)
-            ax.add_patch(Rectangle((c, y), 1, 1, facecolor='black' if g else 'white', edgecolor='gray', zorder=1))
-            ax.text(c + 0.5, y + 0.5, disp[r][c], ha='center', va='center', color='white' if g else 'black', fontsize=9, zorder=2)
-
-    for r, row in enumerate(lines):
+        for c, (label, g) in enumerate(zip(labels, weights)):
+            paths.append(shape(label))
+            offsets.append((c + 0.5, y + 0.5))
+            colors.append('white' if g else 'black')
+    # sizes=[1] scales points to pixels at the output dpi, the way scatter markers are sized
+    ax.add_collection(PathCollection(paths, sizes=[1], offsets=offsets, offset_transform=ax.transData,
+                                     transform=IdentityTransform(), facecolors=colors, edgecolors='none',
+                                     zorder=2), autolim=False)
+
+    # overlays are batched per layer into a single PatchCollection each
+    layers = {3: [], 4: [], 5: []}
+    for r, (row, vip) in enumerate(zip(lines, vipula_rows(grid, lens))):
         y = rows - 1 - r
-        vip = identify_vipula(row)
         if vip:
-            ax.add_patch(Rectangle((0, y), min(4, len(row)), 1, facecolor=vipula_colors[vip], alpha=0.45, zorder=3))
+            layers[3].append(Rectangle((0, y), min(4, len(row)), 1, facecolor=vipula_colors[vip], alpha=0.45))
         if detect_vrttyanuprasa(row):
-            ax.add_patch(Rectangle((0, y), len(row), 1, fill=False, edgecolor='purple', lw=2, zorder=4))
+            layers[4].append(Rectangle((0, y), len(row), 1, fill=False, edgecolor='purple', lw=2))
 
-    for i in range(0, len(flat), 32):
-        blk = flat[i:i+32]
-        if len(blk) < 32:
-            break
-        base = i // cols
+    for b, (pathya, adi, anta) in enumerate(block_flags(flat, grid[~empty])):
+        base = b * 32 // cols
         yb = rows - 1 - base - 1
         if yb < 0:
             continue
         w = min(cols, 8)
-        if classify_pathya(blk):
-            ax.add_patch(Rectangle((0, yb), w, 2, fill=False, edgecolor='blue', lw=2.5, zorder=5))
-        if detect_padayadi_yamaka(blk):
-            ax.add_patch(Rectangle((0, yb), w, 2, fill=False, edgecolor='green', lw=2, linestyle='--', zorder=5))
-        if detect_padaanta_yamaka(blk):
-            ax.add_patch(Rectangle((0, yb), w, 2, fill=False, edgecolor='red', lw=2, linestyle=':', zorder=5))
-
-    st.pyplot(fig)
-    plt.close(fig)
+        if pathya:
+            layers[5].append(Rectangle((0, yb), w, 2, fill=False, edgecolor='blue', lw=2.5))
+        if adi:
+            layers[5].append(Rectangle((0, yb), w, 2, fill=False, edgecolor='green', lw=2, linestyle='--'))
+        if anta:
+            layers[5].append(Rectangle((0, yb), w, 2, fill=False, edgecolor='red', lw=2, linestyle=':'))
+
+    for z, patches in layers.items():
+        if patches:
+            ax.add_collection(PatchCollection(patches, match_original=True, zorder=z))
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', dpi=200)  # st.pyplot's defaults
+    return buf.getvalue()
+
+
+def page_starts(lines: List[Tuple[str, ...]]) -> List[int]:
+    """first line of each page, plus len(lines). A page is cut only after page_padas lines
+    and where the syllables so far are a multiple of 32, so block_flags tests the same
+    32-syllable windows as on one unpaged grid; a page that finds no such cut within
+    2 × page_padas lines is cut there anyway"""
+    starts, total = [0], 0
+    for i, row in enumerate(lines[:-1], 1):
+        total += len(row)
+        n = i - starts[-1]
+        if n >= 2 * page_padas or (n >= page_padas and total % 32 == 0):
+            starts.append(i)
+    return starts + [len(lines)]
+
+
+def visualize_lines(lines: List[Tuple[str, ...]], out=st):
+    """draw the grid into `out` (a container or st.empty() slot) with a single write"""
+    if not lines or not max(map(len, lines)):
+        out.error('No data')
+        return
+    out.image(render_png(lines), use_container_width=True)  # stretch to the column like st.pyplot did
 
 # ===== UI =====
 st.set_page_config(page_title='Sloka Meter', layout='wide')
@@ -153,28 +136,44 @@ st.title('Sloka Meter Visualizer')
 
 st.markdown("**Quick instructions:** Paste IAST, one pāda per line separated by `|`, `।`, or `॥`. Click **Show**. Guru squares are black, laghu white; vipulā are filled; yamaka, anuprāsa, pathyā appear as borders.")
 
-# Sidebar legend (scrolls with the page)
+@st.cache_data
+def legend_html() -> str:
+    legend = [('Guru', 'black', True), ('Laghu', 'white', True)]
+    for n, c in vipula_colors.items():
+        legend.append((f'Vipula {n}', c, True))
+    legend += [
+        ('Vṛtti Anuprāsa', 'purple', False),
+        ('Pathya', 'blue', False),
+        ('Pāda‑ādi Yamaka', 'green', False),
+        ('Pāda‑anta Yamaka', 'red', False)
+    ]
+    html = []
+    for label, col, fill in legend:
+        style = f"background:{col};" if fill else f"border:2px solid {col};"
+        html.append(f"<span style='display:inline-block;width:14px;height:14px;{style}'></span> {label}<br>")
+    return ''.join(html)
+
+# Sidebar legend (scrolls with the page); one markdown element, not one per entry
 st.sidebar.header('Legend')
-legend = [('Guru', 'black', True), ('Laghu', 'white', True)]
-for n, c in vipula_colors.items():
-    legend.append((f'Vipula {n}', c, True))
-legend += [
-    ('Vṛtti Anuprāsa', 'purple', False),
-    ('Pathya', 'blue', False),
-    ('Pāda‑ādi Yamaka', 'green', False),
-    ('Pāda‑anta Yamaka', 'red', False)
-]
-for label, col, fill in legend:
-    style = f"background:{col};" if fill else f"border:2px solid {col};"
-    st.sidebar.markdown(f"<span style='display:inline-block;width:14px;height:14px;{style}'></span> {label}<br>", unsafe_allow_html=True)
-
-text = st.text_area('IAST input:', height=200)
-if st.button('Show'):
-    parts = [p.strip() for p in re.split(r'[।॥|]+', text) if p.strip()]
-    if not parts:
-        st.error('No valid lines found.')
+st.sidebar.markdown(legend_html(), unsafe_allow_html=True)
+
+with st.form('input'):  # editing the text alone doesn't rerun the script; only Show does
+    text = st.text_area('IAST input:', height=200)
+    show = st.form_submit_button('Show')
+if show:
+    st.session_state.shown = text  # keep the grid up across reruns from the page selector
+    st.session_state.page = 1  # new text always opens on its first page
+if 'shown' in st.session_state:
+    lines = analyse(st.session_state.shown)
+    starts = page_starts(lines)
+    pages = len(starts) - 1
+    if pages > 1:  # only the visible page is drawn
+        page = st.number_input(f'Page (of {pages})', 1, pages, key='page')
+        lines = lines[starts[page - 1]:starts[page]]
+    slot = st.empty()  # the figure or an error goes here, one element per run
+    if not lines:
+        slot.error('No valid lines found.')
     else:
-        lines = [split_syllables_slp1(normalize(p)) for p in parts]
-        visualize_lines(lines)
+        visualize_lines(lines, slot)
 
 st.markdown("<div style='text-align:center; font-size:0.9em; margin-top:1em;'>App by Svetlana Kreuzer</div>", unsafe_allow_html=True)